@@ -1,35 +1,33 @@
 import os
 import re
-import io
+import heapq
+import logging
+import threading
+from collections import OrderedDict
 import streamlit as st
 
-# ML similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-
-# Optional parsers
-try:
-    import docx2txt
-except Exception:
-    docx2txt = None
-
-try:
-    import PyPDF2
-except Exception:
-    PyPDF2 = None
+# Heavy / optional dependencies (numpy, pypdf, docx2txt, tiktoken) are imported
+# where they are first used, so a cold start only pays for what the user clicks.
+logger = logging.getLogger(__name__)
 
 
 # ========= OpenAI: robust import + lazy client =========
+@st.cache_resource(show_spinner=False)
 def _sdk_info():
+    """(installed, version) from package metadata; the SDK itself is only imported on first rewrite."""
     try:
-        import openai  # just to read version
-        ver = getattr(openai, "__version__", "unknown")
-        return True, ver
+        from importlib.metadata import version
+        return True, version("openai")
     except Exception:
         return False, None
 
 
-_OPENAI_INSTALLED, _OPENAI_VERSION = _sdk_info()
+OPENAI_MODEL = "gpt-4o-mini"
+# Prompt budget: long inputs cost tokens and latency linearly, so clip each side.
+MAX_RESUME_TOKENS = 3000
+MAX_JD_TOKENS = 1500
+# Finished rewrites kept in memory (LRU across all sessions).
+REWRITE_CACHE_SIZE = 64
 
 
 def get_openai_client():
@@ -37,7 +35,8 @@ def get_openai_client():
     Build a client *when needed*.
     Returns (client, err_msg). If err_msg is not None, show it to the user.
     """
-    if not _OPENAI_INSTALLED:
+    installed, _ = _sdk_info()
+    if not installed:
         return None, "OpenAI SDK not installed. Run: pip install openai"
 
     try:
@@ -57,56 +56,60 @@ def get_openai_client():
 
 
 # ========= Helpers =========
-def extract_text_from_upload(uploaded_file):
-    """Extract plain text from uploaded .txt/.docx/.pdf; fallback to best-effort decode."""
-    if uploaded_file is None:
+# Tokens may contain "." / "-" (node.js, end-to-end) but not end with them,
+# so a keyword at the end of a sentence ("sql.") still matches "sql".
+_WORD = re.compile(r"[a-zA-Z][a-zA-Z\+\#\.\-]*[a-zA-Z\+\#]")
+# Regex-shaped ATS signals in one alternation so the resume is scanned once.
+# Single-character checks (tab, "@") use plain `in`, which skips the regex engine.
+_ATS = re.compile(
+    r"(?P<phone>\d{10}|\(\d{3}\)\s*\d{3}-\d{4})"
+    r"|(?P<edu>education|bachelor|master|university)"
+    r"|(?P<exp>experience|work history|employment)",
+    re.I,
+)
+_QUANT = re.compile(r"\b(\d+%|\d{2,})\b")
+
+
+def _page_text(page) -> str:
+    try:
+        return page.extract_text() or ""
+    except Exception:
         return ""
-    name = uploaded_file.name.lower()
-    content = uploaded_file.read()
+
+
+def _rewind(f):
     try:
-        uploaded_file.seek(0)
+        f.seek(0)
     except Exception:
         pass
 
-    # .txt
-    if name.endswith(".txt"):
-        for enc in ("utf-8", "latin-1"):
-            try:
-                return content.decode(enc, errors="ignore")
-            except Exception:
-                continue
+
+def extract_text_from_upload(uploaded_file):
+    """Extract plain text from uploaded .txt/.docx/.pdf; fallback to best-effort decode."""
+    if uploaded_file is None:
         return ""
+    name = uploaded_file.name.lower()
+    _rewind(uploaded_file)
 
-    # .docx
-    if name.endswith(".docx") and docx2txt is not None:
+    # .docx / .pdf: parse straight from the uploaded stream, no byte copies
+    if name.endswith(".docx"):
         try:
-            tmp = "temp_upload.docx"
-            with open(tmp, "wb") as f:
-                f.write(content)
-            text = docx2txt.process(tmp) or ""
-            try:
-                os.remove(tmp)
-            except Exception:
-                pass
-            return text
+            import docx2txt
+            return docx2txt.process(uploaded_file) or ""
         except Exception:
             pass  # fall through to generic decode
 
-    # .pdf
-    if name.endswith(".pdf") and PyPDF2 is not None:
+    if name.endswith(".pdf"):
         try:
-            reader = PyPDF2.PdfReader(io.BytesIO(content))
-            pages = []
-            for p in reader.pages:
-                try:
-                    pages.append(p.extract_text() or "")
-                except Exception:
-                    pages.append("")
-            return "\n".join(pages)
+            from pypdf import PdfReader
+            reader = PdfReader(uploaded_file)
+            return "\n".join(_page_text(p) for p in reader.pages)
         except Exception:
             pass  # fall through to generic decode
 
-    # Fallback
+    # .txt, or fallback when a parser is missing or failed
+    _rewind(uploaded_file)
+    content = uploaded_file.read()
     for enc in ("utf-8", "latin-1"):
         try:
             return content.decode(enc, errors="ignore")
@@ -116,28 +119,58 @@ def extract_text_from_upload(uploaded_file):
 
 
 def clean_text(t: str) -> str:
-    t = t or ""
-    t = re.sub(r"\s+", " ", t)
-    return t.strip()
+    # Collapse whitespace runs and strip ends (same as re.sub(r"\s+", " ", t).strip()).
+    return " ".join((t or "").split())
 
 
 def keyword_coverage(resume_text: str, jd_text: str):
-    resume = resume_text.lower()
-    words = [w for w in re.findall(r"[a-zA-Z][a-zA-Z\+\#\.\-]{1,}", jd_text.lower()) if len(w) > 2]
-    unique = sorted(set(words))
-    found = [w for w in unique if w in resume]
-    coverage = (len(found) / max(1, len(unique))) * 100.0
-    return coverage, found, unique
+    """Return (coverage %, JD keywords found in the resume, all JD keywords) as sets."""
+    resume_tokens = set(_WORD.findall(resume_text.lower()))
+    jd_tokens = {w for w in _WORD.findall(jd_text.lower()) if len(w) > 2}
+    found = jd_tokens & resume_tokens
+    coverage = (len(found) / max(1, len(jd_tokens))) * 100.0
+    return coverage, found, jd_tokens
+
+
+# Feature-hashing buckets for the similarity vectors (collisions are negligible for a coarse score).
+_HASH_BITS = 18
+_HASH_MASK = (1 << _HASH_BITS) - 1
+
+# Function words dropped before hashing; otherwise they dominate the similarity score.
+_STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before
+being below between both but by can could did do does doing down during each either etc few
+for from further had has have having he her here hers herself him himself his how however i
+if in into is it its itself just may me might more most must my myself no nor not now of off
+on once only or other our ours ourselves out over own per same she should so some such than
+that the their theirs them themselves then there these they this those through to too under
+until up upon us very via was we well were what when where whether which while who whom why
+will with within without would yet you your yours yourself yourselves
+""".split())
+
+
+def _hashed_tf(text: str):
+    """Dense, l2-normalized vector of hashed unigram + bigram counts with sublinear TF."""
+    import numpy as np
+
+    tokens = [t for t in _WORD.findall(text.lower()) if t not in _STOP_WORDS]
+    idx = [hash(t) & _HASH_MASK for t in tokens]
+    idx += [hash(pair) & _HASH_MASK for pair in zip(tokens, tokens[1:])]
+    arr = np.bincount(np.asarray(idx, dtype=np.intp), minlength=_HASH_MASK + 1).astype(np.float32)
+    np.log1p(arr, out=arr)
+    n = np.linalg.norm(arr)
+    return arr / n if n else arr
 
 
 def similarity_score(resume_text: str, jd_text: str) -> float:
-    docs = [resume_text, jd_text]
-    vec = TfidfVectorizer(stop_words="english", ngram_range=(1, 2))
+    import numpy as np
+
     try:
-        X = vec.fit_transform(docs)
-        sim = cosine_similarity(X[0:1], X[1:2])[0, 0] * 100.0
+        # Both vectors are unit length, so their dot product is the cosine.
+        sim = np.dot(_hashed_tf(resume_text), _hashed_tf(jd_text)) * 100.0
         return float(sim)
     except Exception:
+        logger.exception("Similarity scoring failed")
         return 0.0
 
 
@@ -145,26 +178,30 @@ def detect_ats_issues(resume_text: str):
     issues = []
     if len(resume_text) < 500:
         issues.append("Resume seems short. Add detail and measurable achievements.")
-    if re.search(r"\t", resume_text):
+    seen = set()
+    for m in _ATS.finditer(resume_text):
+        seen.add(m.lastgroup)
+        if len(seen) == 3:
+            break
+    if "\t" in resume_text:
         issues.append("Avoid TAB characters; some ATS parsers misread complex formatting.")
-    if not re.search(r"@", resume_text):
+    if "@" not in resume_text:
         issues.append("Missing contact email.")
-    if not re.search(r"\d{10}", resume_text) and not re.search(r"\(\d{3}\)\s*\d{3}-\d{4}", resume_text):
+    if "phone" not in seen:
         issues.append("Missing phone number.")
-    if not re.search(r"education|bachelor|master|university", resume_text, flags=re.I):
+    if "edu" not in seen:
         issues.append("Education section not detected (use heading 'Education').")
-    if not re.search(r"experience|work history|employment", resume_text, flags=re.I):
+    if "exp" not in seen:
         issues.append("Experience section not detected (use heading 'Experience').")
     return issues
 
 
-def generate_suggestions(resume_text: str, jd_text: str, found_keywords):
+def generate_suggestions(resume_text: str, found_keywords, all_keywords):
     suggestions = []
-    _, _, all_keywords = keyword_coverage(resume_text, jd_text)
-    missing = [w for w in all_keywords if w not in found_keywords][:15]
+    missing = heapq.nsmallest(10, all_keywords - found_keywords)
     if missing:
-        suggestions.append(f"Add relevant JD keywords (missing examples: {', '.join(missing[:10])}).")
-    if not re.search(r"\b(\d+%|\d{2,})\b", resume_text):
+        suggestions.append(f"Add relevant JD keywords (missing examples: {', '.join(missing)}).")
+    if not _QUANT.search(resume_text):
         suggestions.append("Quantify achievements (e.g., 'Improved accuracy by 12%', 'Processed 1M+ rows').")
     if resume_text.count("•") < 3 and resume_text.count("- ") < 3:
         suggestions.append("Use concise bullet points with action verbs (Built, Led, Automated, Reduced).")
@@ -172,6 +209,101 @@ def generate_suggestions(resume_text: str, jd_text: str, found_keywords):
     return suggestions
 
 
+@st.cache_resource(show_spinner=False)
+def _get_encoding(model: str = OPENAI_MODEL):
+    # Raises on failure (missing package, BPE download error) so the failure isn't cached.
+    import tiktoken
+    return tiktoken.encoding_for_model(model)
+
+
+def clip_tokens(text: str, max_tokens: int):
+    """
+    Trim text to at most max_tokens tokens (~4 chars/token if tiktoken is unavailable).
+    Returns (text, clipped) so callers can tell the user when input was cut.
+    """
+    try:
+        enc = _get_encoding()
+    except Exception:
+        return text[: max_tokens * 4], len(text) > max_tokens * 4
+    ids = enc.encode(text)
+    if len(ids) > max_tokens:
+        return enc.decode(ids[:max_tokens]), True
+    return text, False
+
+
+@st.cache_data(show_spinner=False)
+def analyze(resume_text: str, jd_text: str) -> dict:
+    """Run every check on a cleaned resume/JD pair; cached so unchanged inputs skip all of it."""
+    coverage, found, all_keywords = keyword_coverage(resume_text, jd_text)
+    return {
+        "sim": similarity_score(resume_text, jd_text),
+        "coverage": coverage,
+        "found": found,
+        "issues": detect_ats_issues(resume_text),
+        "suggestions": generate_suggestions(resume_text, found, all_keywords),
+    }
+
+
+def build_rewrite_prompt(resume_text: str, jd_text: str) -> str:
+    """Expects texts already clipped to the prompt budget (see clip_tokens)."""
+    return f"""
+You are an expert resume editor. Rewrite the RESUME to better match the JOB DESCRIPTION.
+- Keep only truthful content (no fake experience).
+- Keep ATS-friendly formatting (plain text, clear section headings).
+- Add missing keywords naturally.
+- Quantify achievements where possible.
+- Output plain text only (no markdown).
+
+--- RESUME ---
+{resume_text}
+
+--- JOB DESCRIPTION ---
+{jd_text}
+"""
+
+
+def stream_rewrite(client, resume_text: str, jd_text: str, model: str = OPENAI_MODEL):
+    """
+    Send the rewrite request now and return a generator over the response tokens,
+    so callers can show a spinner until the stream opens.
+    """
+    resp = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": build_rewrite_prompt(resume_text, jd_text)}],
+        temperature=0.3,
+        stream=True,
+    )
+    return (chunk.choices[0].delta.content or "" for chunk in resp if chunk.choices)
+
+
+@st.cache_resource(show_spinner=False)
+def _rewrite_cache():
+    """
+    Finished rewrites keyed on (resume_text, jd_text, model), shared across sessions
+    so identical requests aren't re-billed. A stream can't go through st.cache_data,
+    so this is a bounded LRU (REWRITE_CACHE_SIZE entries) plus a lock for concurrent sessions.
+    """
+    return OrderedDict(), threading.Lock()
+
+
+def _rewrite_cache_get(key):
+    cache, lock = _rewrite_cache()
+    with lock:
+        revised = cache.get(key)
+        if revised is not None:
+            cache.move_to_end(key)
+        return revised
+
+
+def _rewrite_cache_put(key, revised: str):
+    cache, lock = _rewrite_cache()
+    with lock:
+        cache[key] = revised
+        cache.move_to_end(key)
+        while len(cache) > REWRITE_CACHE_SIZE:
+            cache.popitem(last=False)
+
+
 def example_bullets():
     return [
         "Built and deployed an end-to-end ML pipeline in Python (scikit-learn), improving prediction accuracy by 12%.",
@@ -195,7 +327,8 @@ with st.sidebar:
         "4) (Optional) Use **AI Rewrite** to tailor your resume"
     )
     st.subheader("AI Status")
-    st.write(f"OpenAI SDK installed: **{_OPENAI_INSTALLED}**" + (f" (v{_OPENAI_VERSION})" if _OPENAI_VERSION else ""))
+    sdk_installed, sdk_version = _sdk_info()
+    st.write(f"OpenAI SDK installed: **{sdk_installed}**" + (f" (v{sdk_version})" if sdk_version else ""))
     st.write("API key detected: **" + ("Yes" if os.getenv("OPENAI_API_KEY") else "No") + "**")
     st.caption('If "No", set it in this terminal:\n$env:OPENAI_API_KEY="sk-..." and restart the app.')
 
@@ -226,26 +359,31 @@ if st.button("🔎 Score My Resume", type="primary"):
             st.session_state.rt = rt
             st.session_state.jd = jd
 
-            sim = similarity_score(rt, jd)
-            coverage, found, _ = keyword_coverage(rt, jd)
-            issues = detect_ats_issues(rt)
-            sugg = generate_suggestions(rt, jd, found)
+            # Re-clicking Score with unchanged inputs reuses this session's last results.
+            key = (rt, jd)
+            if st.session_state.get("last_key") == key:
+                results = st.session_state["last_results"]
+            else:
+                results = analyze(rt, jd)
+                st.session_state["last_key"] = key
+                st.session_state["last_results"] = results
+            found = results["found"]
 
             st.subheader("Results")
             c1, c2 = st.columns(2)
-            c1.metric("Resume ↔ JD Match (TF-IDF)", f"{sim:.1f}%")
-            c2.metric("Keyword Coverage", f"{coverage:.1f}%")
+            c1.metric("Resume ↔ JD Match (cosine)", f"{results['sim']:.1f}%")
+            c2.metric("Keyword Coverage", f"{results['coverage']:.1f}%")
 
             st.markdown("**Keywords detected in your resume (from JD)**")
-            st.write(", ".join(found[:100]) if found else "_No JD keywords detected in resume text._")
+            st.write(", ".join(heapq.nsmallest(100, found)) if found else "_No JD keywords detected in resume text._")
 
-            if issues:
+            if results["issues"]:
                 st.markdown("### ATS-style Checks (basic)")
-                for i in issues:
+                for i in results["issues"]:
                     st.warning(i)
 
             st.markdown("### Suggestions to Improve")
-            for s in sugg:
+            for s in results["suggestions"]:
                 st.info("• " + s)
 
             st.markdown("### Example Bullet Points You Can Adapt")
@@ -263,36 +401,36 @@ if not st.session_state.rt or not st.session_state.jd:
     st.info("Add a resume and JD above, then click **Score My Resume** first. The rewrite uses those texts.")
 else:
     if st.button("Rewrite my resume for this JD"):
-        client, err = get_openai_client()
-        if err:
-            st.error(err)
-        else:
-            with st.spinner("Rewriting…"):
-                prompt = f"""
-You are an expert resume editor. Rewrite the RESUME to better match the JOB DESCRIPTION.
-- Keep only truthful content (no fake experience).
-- Keep ATS-friendly formatting (plain text, clear section headings).
-- Add missing keywords naturally.
-- Quantify achievements where possible.
-- Output plain text only (no markdown).
-
---- RESUME ---
-{st.session_state.rt}
-
---- JOB DESCRIPTION ---
-{st.session_state.jd}
-"""
+        resume_for_prompt, resume_clipped = clip_tokens(st.session_state.rt, MAX_RESUME_TOKENS)
+        jd_for_prompt, _ = clip_tokens(st.session_state.jd, MAX_JD_TOKENS)
+        key = (st.session_state.rt, st.session_state.jd, OPENAI_MODEL)
+        revised = _rewrite_cache_get(key)
+        if revised is None:
+            client, err = get_openai_client()
+            if err:
+                st.error(err)
+            else:
+                preview = st.empty()
                 try:
-                    resp = client.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=[{"role": "user", "content": prompt}],
-                        temperature=0.3,
-                    )
-                    revised = resp.choices[0].message.content.strip()
-                    st.download_button("Download Revised Resume (TXT)", revised, file_name="revised_resume.txt")
-                    st.text_area("Revised Resume (preview)", revised, height=350)
+                    with st.spinner("Rewriting…"):
+                        tokens = stream_rewrite(client, resume_for_prompt, jd_for_prompt)
+                    revised = preview.write_stream(tokens).strip()
                 except Exception as e:
                     st.error(f"Rewrite failed: {e}")
+                finally:
+                    preview.empty()
+                if revised:
+                    _rewrite_cache_put(key, revised)
+                elif revised is not None:
+                    st.warning("The model returned an empty rewrite. Please try again.")
+        if revised:
+            if resume_clipped:
+                st.warning(
+                    f"Your resume is longer than the rewrite budget ({MAX_RESUME_TOKENS} tokens), "
+                    "so this rewrite only covers the first part of it."
+                )
+            st.download_button("Download Revised Resume (TXT)", revised, file_name="revised_resume.txt")
+            st.text_area("Revised Resume (preview)", revised, height=350)
 
 st.markdown("---")
 st.caption("Starter template. Next: persistence (SQLite/Supabase), multi-JD ranking, and Stripe paywall.")